@@ -1,14 +1,17 @@
+import os
+
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 
 from data_utils import (
     load_data,
     build_graph,
-    compute_dependency_subgraph,
+    build_csr,
     classify_nodes,
     build_edges,
-    compute_impact_metrics
+    analyze_focus
 )
 
 # --------------------------------------------------
@@ -22,45 +25,98 @@ st.set_page_config(
 # --------------------------------------------------
 # Load data
 # --------------------------------------------------
-meta, nodes, matrix = load_data("supply_chain_dummy_data1.xlsx")
+DATA_PATH = "supply_chain_dummy_data1.xlsx"
+
+meta, nodes, matrix = load_data(DATA_PATH)
+
+# Part of every view cache key, so edits to the workbook invalidate them
+data_version = os.path.getmtime(DATA_PATH)
 meta_dict = dict(zip(meta["key"], meta["value"]))
 
+# Node ids must be unique: edge construction and the code-indexed
+# geo_pos arrays below both assume one row per id
+if not nodes["id"].is_unique:
+    duplicates = sorted(set(nodes.loc[nodes["id"].duplicated(), "id"]))
+    st.error(f"Duplicate node ids in NODES: {', '.join(duplicates)}")
+    st.stop()
+
+# Categorical ids/regions keep the per-rerun isin filters on int codes
+nodes["region"] = nodes["region"].astype("category")
+nodes["id"] = nodes["id"].astype("category")
+
 # --------------------------------------------------
 # Build edges + graph (single source of truth)
 # --------------------------------------------------
 edges = build_edges(nodes, matrix)
+
+# MATRIX rows may name ids that NODES lacks; drop those edges up front
+# rather than letting the categorical cast turn them into NaN
+unknown = ~(
+    edges["from"].isin(nodes["id"]) &
+    edges["to"].isin(nodes["id"])
+)
+if unknown.any():
+    referenced = (
+        set(edges.loc[unknown, "from"]) |
+        set(edges.loc[unknown, "to"])
+    )
+    missing = sorted(referenced - set(nodes["id"]))
+    st.warning(
+        f"Dropping {int(unknown.sum())} edge(s) with ids missing "
+        f"from NODES: {', '.join(missing)}"
+    )
+    edges = edges[~unknown].reset_index(drop=True)
+
+edges["from"] = edges["from"].astype(nodes["id"].dtype)
+edges["to"] = edges["to"].astype(nodes["id"].dtype)
+
 G = build_graph(nodes, edges)
+csr = build_csr(nodes, edges)
 
 # --------------------------------------------------
 # Geographic positions
 # --------------------------------------------------
-geo_pos = {
-    row["id"]: (row["longitude"], row["latitude"])
-    for _, row in nodes.iterrows()
-}
+# (lon, lat) arrays indexed by the node id category code
+node_coords = nodes.set_index("id").loc[nodes["id"].cat.categories]
+geo_pos = (
+    node_coords["longitude"].to_numpy(dtype=np.float64),
+    node_coords["latitude"].to_numpy(dtype=np.float64)
+)
 
 # --------------------------------------------------
 # Map figure (pure presentation)
 # --------------------------------------------------
 def build_map_figure(filtered_nodes, filtered_edges, node_roles, geo_pos):
-    edge_traces = []
-
-    for _, row in filtered_edges.iterrows():
-        u, v, w = row["from"], row["to"], row["weight"]
-        lon0, lat0 = geo_pos[u]
-        lon1, lat1 = geo_pos[v]
-
-        edge_traces.append(
-            go.Scattergeo(
-                lon=[lon0, lon1],
-                lat=[lat0, lat1],
-                mode="lines",
-                line=dict(width=1, color="gray"),
-                hoverinfo="text",
-                text=f"{u} → {v} | weight {w}",
-                showlegend=False
-            )
-        )
+    # All edges go into one trace: (start, end, NaN) per segment,
+    # the NaN breaking the line between consecutive edges
+    lon_arr, lat_arr = geo_pos
+    u_codes = filtered_edges["from"].cat.codes.to_numpy()
+    v_codes = filtered_edges["to"].cat.codes.to_numpy()
+
+    # Code -1 (id outside the categories) would wrap to the last node
+    if (u_codes < 0).any() or (v_codes < 0).any():
+        raise ValueError("Edge endpoints must be ids present in NODES")
+
+    lons = np.full(3 * len(filtered_edges), np.nan)
+    lats = np.full(3 * len(filtered_edges), np.nan)
+    lons[0::3], lats[0::3] = lon_arr.take(u_codes), lat_arr.take(u_codes)
+    lons[1::3], lats[1::3] = lon_arr.take(v_codes), lat_arr.take(v_codes)
+
+    edge_hover = (
+        filtered_edges["from"].astype(str) + " → " +
+        filtered_edges["to"].astype(str) + " | weight " +
+        filtered_edges["weight"].astype(str)
+    ).to_numpy()
+
+    edge_trace = go.Scattermap(
+        lon=lons,
+        lat=lats,
+        mode="lines",
+        line=dict(width=1, color="gray"),
+        hoverinfo="text",
+        text=np.repeat(edge_hover, 3),
+        showlegend=False
+    )
 
     color_map = {
         "focus": "gold",
@@ -68,12 +124,15 @@ def build_map_figure(filtered_nodes, filtered_edges, node_roles, geo_pos):
         "downstream": "steelblue"
     }
 
-    node_colors = [
-        color_map.get(node_roles.get(n), "lightgray")
-        for n in filtered_nodes["id"]
-    ]
+    node_colors = (
+        filtered_nodes["id"]
+        .map(node_roles)
+        .map(color_map)
+        .fillna("lightgray")
+        .to_numpy()
+    )
 
-    node_trace = go.Scattergeo(
+    node_trace = go.Scattermap(
         lon=filtered_nodes["longitude"],
         lat=filtered_nodes["latitude"],
         mode="markers",
@@ -81,53 +140,128 @@ def build_map_figure(filtered_nodes, filtered_edges, node_roles, geo_pos):
         text=filtered_nodes["label"],
         marker=dict(
             size=8,
-            color=node_colors,
-            line=dict(width=1, color="black")
+            color=node_colors
         ),
         showlegend=False
     )
 
-    fig = go.Figure(edge_traces + [node_trace])
+    fig = go.Figure([edge_trace, node_trace])
 
+    # WebGL map; uirevision keeps pan/zoom across Streamlit reruns
     fig.update_layout(
         title=None,
-        geo=dict(
-            projection_type="miller",
-            showland=True,
-            landcolor="rgb(245,245,245)",
-            showocean=True,
-            oceancolor="rgb(230,236,245)",
-            showcountries=True,
-            countrycolor="rgb(180,180,180)",
-            showcoastlines=True,
-            coastlinecolor="rgb(170,170,170)",
-            showframe=False,
-            bgcolor="white",
+        map=dict(
+            style="carto-positron",
+            center=dict(lat=20, lon=0),
+            zoom=1
         ),
+        uirevision="static",
         margin=dict(l=20, r=20, t=20, b=20),
         height=650
     )
 
     return fig
 
+# --------------------------------------------------
+# View computation (memoised on widget values)
+# --------------------------------------------------
+# Shared by all sessions; bound how many parameter sets are kept
+VIEW_CACHE_ENTRIES = 128
+
+@st.cache_data(show_spinner=False)
+def analyze(focus_node, max_depth, data_version, _G, _nodes, _csr):
+    # Only (focus_node, max_depth, data_version) form the key; the
+    # graph is cached separately as a resource
+    upstream, downstream, _, impact = analyze_focus(
+        _G,
+        _nodes,
+        focus_node,
+        max_depth=max_depth,
+        csr=_csr
+    )
+
+    return upstream, downstream, impact
+
+
+@st.cache_data(show_spinner=False, max_entries=VIEW_CACHE_ENTRIES)
+def compute_view(
+    focus_node, depth, view_mode, min_weight, regions_key, data_version
+):
+    selected_regions = list(regions_key)
+
+    # --------------------------------------------------
+    # Dependency analysis (delegated)
+    # --------------------------------------------------
+    upstream, downstream, impact = analyze(
+        focus_node, depth, data_version, G, nodes, csr
+    )
+
+    if view_mode == "Downstream":
+        visible_nodes = {focus_node} | downstream
+    elif view_mode == "Upstream":
+        visible_nodes = {focus_node} | upstream
+    else:  # Both
+        visible_nodes = {focus_node} | upstream | downstream
+
+
+    node_roles = classify_nodes(focus_node, upstream, downstream)
+
+
+    # Apply region + visibility filtering
+    mask = (
+        nodes["region"].isin(selected_regions) &
+        nodes["id"].isin(visible_nodes)
+    )
+    filtered_nodes = nodes[mask]
+
+    filtered_edges = edges[
+        (edges["from"].isin(visible_nodes)) &
+        (edges["to"].isin(visible_nodes)) &
+        (edges["weight"] >= min_weight)
+    ]
+
+    return filtered_nodes, filtered_edges, node_roles, impact
+
+
+@st.cache_data(show_spinner=False, max_entries=VIEW_CACHE_ENTRIES)
+def compute_map_figure(
+    focus_node, depth, view_mode, min_weight, regions_key, data_version
+):
+    filtered_nodes, filtered_edges, node_roles, _ = compute_view(
+        focus_node, depth, view_mode, min_weight, regions_key, data_version
+    )
+
+    return build_map_figure(
+        filtered_nodes,
+        filtered_edges,
+        node_roles,
+        geo_pos
+    )
+
 # --------------------------------------------------
 # Sidebar controls
 # --------------------------------------------------
+@st.cache_data(show_spinner=False)
+def _node_selector(nodes, edges):
+    nodes_sorted = nodes.sort_values("size", ascending=False)
+    node_options = dict(zip(nodes_sorted["label"], nodes_sorted["id"]))
+    regions = sorted(nodes["region"].unique())
+    return node_options, regions, int(edges["weight"].max())
+
+
+node_options, regions, max_weight = _node_selector(nodes, edges)
+
 st.sidebar.markdown("## Supply Chain Dependency Map")
 
-regions = sorted(nodes["region"].unique())
 selected_regions = st.sidebar.multiselect("Regions", regions, default=regions)
 
 min_weight = st.sidebar.slider(
     "Minimum dependency weight",
     min_value=1,
-    max_value=int(edges["weight"].max()),
+    max_value=max_weight,
     value=1
 )
 
-nodes_sorted = nodes.sort_values("size", ascending=False)
-node_options = dict(zip(nodes_sorted["label"], nodes_sorted["id"]))
-
 focus_label = st.sidebar.selectbox("Focus node", node_options.keys())
 focus_node = node_options[focus_label]
 
@@ -141,57 +275,20 @@ view_mode = st.sidebar.radio(
 
 
 # --------------------------------------------------
-# Filtering
+# Filtering + dependency analysis (cached per signature)
 # --------------------------------------------------
-filtered_nodes = nodes[nodes["region"].isin(selected_regions)]
+regions_key = tuple(sorted(selected_regions))
 
-filtered_edges = edges[
-    (edges["from"].isin(filtered_nodes["id"])) &
-    (edges["to"].isin(filtered_nodes["id"])) &
-    (edges["weight"] >= min_weight)
-]
-
-# --------------------------------------------------
-# Dependency analysis (delegated)
-# --------------------------------------------------
-upstream, downstream, subgraph = compute_dependency_subgraph(
-    G,
-    focus_node,
-    max_depth=depth
-)
-
-if view_mode == "Downstream":
-    visible_nodes = {focus_node} | downstream
-elif view_mode == "Upstream":
-    visible_nodes = {focus_node} | upstream
-else:  # Both
-    visible_nodes = {focus_node} | upstream | downstream
-
-
-impact = compute_impact_metrics(
-    G,
-    nodes,
+filtered_nodes, filtered_edges, node_roles, impact = compute_view(
     focus_node,
-    max_depth=depth
+    depth,
+    view_mode,
+    min_weight,
+    regions_key,
+    data_version
 )
 
 
-node_roles = classify_nodes(focus_node, upstream, downstream)
-
-
-# Apply region + visibility filtering
-filtered_nodes = nodes[
-    (nodes["region"].isin(selected_regions)) &
-    (nodes["id"].isin(visible_nodes))
-]
-
-filtered_edges = edges[
-    (edges["from"].isin(visible_nodes)) &
-    (edges["to"].isin(visible_nodes)) &
-    (edges["weight"] >= min_weight)
-]
-
-
 st.subheader("Impact metrics")
 
 col1, col2, col3, col4 = st.columns(4)
@@ -212,11 +309,13 @@ with col4:
 # --------------------------------------------------
 # Render
 # --------------------------------------------------
-fig = build_map_figure(
-    filtered_nodes,
-    filtered_edges,
-    node_roles,
-    geo_pos
+fig = compute_map_figure(
+    focus_node,
+    depth,
+    view_mode,
+    min_weight,
+    regions_key,
+    data_version
 )
 
 
@@ -1,13 +1,22 @@
+import os
+
+import numpy as np
 import pandas as pd
 import networkx as nx
 import streamlit as st
+from numba import njit
 
 # --------------------------------------------------
 # Data loading
 # --------------------------------------------------
-@st.cache_data
 def load_data(path):
-    xls = pd.ExcelFile(path)
+    # Keyed on mtime so edits to the workbook invalidate the disk cache
+    return _read_workbook(path, os.path.getmtime(path))
+
+
+@st.cache_data(persist="disk", show_spinner=False)
+def _read_workbook(path, mtime):
+    xls = pd.ExcelFile(path, engine="calamine")
     meta = pd.read_excel(xls, "META")
     nodes = pd.read_excel(xls, "NODES")
     matrix = pd.read_excel(xls, "MATRIX")
@@ -17,22 +26,27 @@ def load_data(path):
 # --------------------------------------------------
 # Edge & graph construction
 # --------------------------------------------------
+def _hash_frame(df):
+    # Cheap content key for cached functions taking DataFrames;
+    # hash_pandas_object covers row values only, not labels or dtypes
+    return (
+        df.shape,
+        tuple(df.columns),
+        tuple(map(str, df.dtypes)),
+        pd.util.hash_pandas_object(df, index=False).values.tobytes()
+    )
+
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _hash_frame})
 def build_edges(nodes, matrix):
-    edges = []
     node_ids = nodes["id"].tolist()
 
-    for _, row in matrix.iterrows():
-        src = row["FROM/TO"]
-        for tgt in node_ids:
-            w = row[tgt]
-            if w > 0:
-                edges.append({
-                    "from": src,
-                    "to": tgt,
-                    "weight": w
-                })
+    # stack keeps the old source-major order (matrix row, then node)
+    long = matrix.set_index("FROM/TO")[node_ids].stack()
+    long = long[long > 0]
+    long.index.names = ["from", "to"]
 
-    return pd.DataFrame(edges)
+    return long.rename("weight").reset_index()
 
 
 def generate_edge_list(nodes, matrix):
@@ -46,24 +60,68 @@ def generate_edge_list(nodes, matrix):
     return edges
 
 
+@st.cache_resource(show_spinner=False, hash_funcs={pd.DataFrame: _hash_frame})
 def build_graph(nodes, edges):
-    G = nx.MultiDiGraph()
-
-    for _, row in nodes.iterrows():
-        G.add_node(row["id"], **row.to_dict())
-
-    for _, row in edges.iterrows():
-        G.add_edge(
-            row["from"],
-            row["to"],
-            weight=row["weight"],
-            type=row.get("type", None),
-            active=row.get("active", True)
-        )
+    # build_edges emits at most one edge per (from, to) pair
+    edge_attrs = [
+        c for c in ("weight", "type", "active")
+        if c in edges.columns
+    ]
+
+    G = nx.from_pandas_edgelist(
+        edges,
+        source="from",
+        target="to",
+        edge_attr=edge_attrs,
+        create_using=nx.DiGraph
+    )
+
+    G.add_nodes_from(zip(nodes["id"], nodes.to_dict("records")))
 
     return G
 
 
+def _csr(src_idx, dst_idx, n):
+    order = np.argsort(src_idx, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src_idx, minlength=n), out=indptr[1:])
+    return indptr, dst_idx[order]
+
+
+@st.cache_resource(show_spinner=False, hash_funcs={pd.DataFrame: _hash_frame})
+def build_csr(nodes, edges):
+    """
+    Returns the graph as CSR adjacency arrays over contiguous
+    integer node indices, for both edge directions, plus flat
+    per-edge endpoint/weight arrays.
+    """
+    ids = pd.unique(np.concatenate([
+        nodes["id"].to_numpy(dtype=object),
+        edges["from"].to_numpy(dtype=object),
+        edges["to"].to_numpy(dtype=object)
+    ]))
+    index = {node_id: i for i, node_id in enumerate(ids)}
+    n = len(ids)
+
+    from_idx = pd.Index(ids).get_indexer(edges["from"])
+    to_idx = pd.Index(ids).get_indexer(edges["to"])
+
+    out_indptr, out_indices = _csr(from_idx, to_idx, n)
+    in_indptr, in_indices = _csr(to_idx, from_idx, n)
+
+    return {
+        "ids": ids,
+        "index": index,
+        "out_indptr": out_indptr,
+        "out_indices": out_indices,
+        "in_indptr": in_indptr,
+        "in_indices": in_indices,
+        "edge_from": from_idx,
+        "edge_to": to_idx,
+        "edge_weight": edges["weight"].to_numpy(),
+    }
+
+
 # --------------------------------------------------
 # Diagnostics & validation helpers
 # --------------------------------------------------
@@ -84,11 +142,22 @@ def find_nodes_with_missing_coords(nodes):
     ]
 
 
-def find_isolated_nodes(graph):
-    return [
-        n for n in graph.nodes
-        if graph.in_degree(n) == 0 and graph.out_degree(n) == 0
-    ]
+def find_isolated_nodes(graph, csr=None):
+    if csr is not None:
+        out_indptr, in_indptr = csr["out_indptr"], csr["in_indptr"]
+        iso_mask = (
+            (out_indptr[1:] == out_indptr[:-1]) &
+            (in_indptr[1:] == in_indptr[:-1])
+        )
+        return csr["ids"][iso_mask].tolist()
+
+    node_ids = np.asarray(list(graph.nodes()), dtype=object)
+    deg = np.fromiter(
+        (d for _, d in graph.degree()),
+        dtype=np.int64,
+        count=len(node_ids)
+    )
+    return node_ids[deg == 0].tolist()
 
 
 def edge_weight_distribution(edges):
@@ -101,60 +170,172 @@ def strongest_edges(edges, n=10):
 # --------------------------------------------------
 # Dependency computations
 # --------------------------------------------------
+# Direction-switching thresholds from Beamer et al.
+BFS_ALPHA = 14
+BFS_BETA = 24
+
+
+def _reachable(graph, start, max_depth, reverse=False):
+    """
+    Returns the nodes reachable from start in 1..max_depth hops
+    (upstream when reverse=True). The start node is only included
+    if a cycle leads back to it.
+
+    Level-synchronous BFS that switches to a bottom-up sweep over
+    unvisited nodes while the frontier is large.
+    """
+
+    if reverse:
+        forward, backward = graph.predecessors, graph.successors
+        forward_deg, backward_deg = graph.in_degree, graph.out_degree
+    else:
+        forward, backward = graph.successors, graph.predecessors
+        forward_deg, backward_deg = graph.out_degree, graph.in_degree
+
+    n_nodes = graph.number_of_nodes()
+    unvisited_edges = graph.number_of_edges()
+
+    visited = set()
+    unvisited = None
+    frontier = {start}
+    bottom_up = False
+
+    for _ in range(max_depth):
+        if not frontier:
+            break
+
+        frontier_edges = sum(d for _, d in forward_deg(frontier))
+
+        if not bottom_up:
+            bottom_up = frontier_edges > unvisited_edges / BFS_ALPHA
+        else:
+            bottom_up = len(frontier) >= n_nodes / BFS_BETA
+
+        if bottom_up:
+            if unvisited is None:
+                unvisited = set(graph).difference(visited)
+            next_frontier = {
+                u for u in unvisited
+                if any(p in frontier for p in backward(u))
+            }
+        else:
+            next_frontier = set()
+            for n in frontier:
+                next_frontier.update(forward(n))
+            next_frontier -= visited
+
+        if unvisited is not None:
+            unvisited -= next_frontier
+
+        visited |= next_frontier
+        unvisited_edges -= sum(d for _, d in backward_deg(next_frontier))
+        frontier = next_frontier
+
+    return visited
+
+
+@njit(cache=True)
+def _bfs_levels(indptr, indices, start, max_depth):
+    """
+    CSR counterpart of _reachable: returns a boolean mask over
+    node indices reachable from start in 1..max_depth hops.
+    JIT-compiled; frontier buffers are preallocated.
+    """
+
+    n = len(indptr) - 1
+    visited = np.zeros(n, dtype=np.bool_)
+    frontier = np.empty(n, dtype=np.int64)
+    nxt = np.empty(n, dtype=np.int64)
+
+    frontier[0] = start
+    fsz = 1
+
+    for _ in range(max_depth):
+        nsz = 0
+        for i in range(fsz):
+            v = frontier[i]
+            for j in range(indptr[v], indptr[v + 1]):
+                w = indices[j]
+                if not visited[w]:
+                    visited[w] = True
+                    nxt[nsz] = w
+                    nsz += 1
+        frontier, nxt = nxt, frontier
+        fsz = nsz
+        if fsz == 0:
+            break
+
+    return visited
+
+
 def compute_dependency_subgraph(
     graph,
     focus_node,
-    max_depth=1
+    max_depth=1,
+    csr=None
 ):
     """
     Returns sets of upstream nodes, downstream nodes,
-    and the induced subgraph containing only relevant edges.
+    and a read-only view of the induced subgraph containing
+    only relevant edges (None when max_depth is 0).
+    Traverses the CSR arrays from build_csr when given.
     """
 
+    return _dependency_subgraph(graph, focus_node, max_depth, csr)[:3]
+
+
+def _dependency_subgraph(graph, focus_node, max_depth, csr):
+    # Also returns the CSR downstream mask and focus index (None
+    # without a CSR) so analyze_focus can reuse them directly
     if focus_node is None or focus_node not in graph:
-        return set(), set(), graph
+        return set(), set(), graph, None, None
 
-    upstream = set()
-    downstream = set()
+    if csr is None:
+        if max_depth == 0:
+            return set(), set(), None, None, None
 
-    # Upstream traversal
-    current = {focus_node}
-    for _ in range(max_depth):
-        parents = set()
-        for n in current:
-            parents |= set(graph.predecessors(n))
-        upstream |= parents
-        current = parents
-
-    # Downstream traversal
-    current = {focus_node}
-    for _ in range(max_depth):
-        children = set()
-        for n in current:
-            children |= set(graph.successors(n))
-        downstream |= children
-        current = children
+        upstream = _reachable(graph, focus_node, max_depth, reverse=True)
+        downstream = _reachable(graph, focus_node, max_depth)
+        down_mask = start = None
+    else:
+        ids = csr["ids"]
+        start = csr["index"][focus_node]
+
+        if max_depth == 0:
+            return set(), set(), None, np.zeros(len(ids), dtype=bool), start
+
+        up_mask = _bfs_levels(
+            csr["in_indptr"], csr["in_indices"], start, max_depth
+        )
+        down_mask = _bfs_levels(
+            csr["out_indptr"], csr["out_indices"], start, max_depth
+        )
+        upstream = set(ids[up_mask])
+        downstream = set(ids[down_mask])
 
     relevant_nodes = upstream | downstream | {focus_node}
 
-    subgraph = graph.subgraph(relevant_nodes).copy()
+    subgraph = graph.subgraph(relevant_nodes)
 
-    return upstream, downstream, subgraph
+    return upstream, downstream, subgraph, down_mask, start
 
 def classify_nodes(focus_node, upstream, downstream):
     """
-    Returns a dict: node_id -> role
+    Returns a Series: node_id -> role
     """
-    roles = {}
-
-    for n in upstream:
-        roles[n] = "upstream"
-
-    for n in downstream:
-        roles[n] = "downstream"
-
-    if focus_node is not None:
-        roles[focus_node] = "focus"
+    roles = pd.concat([
+        pd.Series("upstream", index=list(upstream), dtype=object),
+        pd.Series("downstream", index=list(downstream), dtype=object),
+        pd.Series(
+            "focus",
+            index=[] if focus_node is None else [focus_node],
+            dtype=object
+        ),
+    ])
+
+    # Later roles take precedence, as focus > downstream > upstream
+    roles = roles[~roles.index.duplicated(keep="last")]
+    roles.name = "role"
 
     return roles
 
@@ -163,63 +344,71 @@ def compute_impact_metrics(
     graph,
     nodes_df,
     focus_node,
-    max_depth=1
+    max_depth=1,
+    csr=None
 ):
     """
     Computes upstream and downstream impact metrics
     for a given focus node.
     """
 
+    return analyze_focus(graph, nodes_df, focus_node, max_depth, csr)[3]
+
+
+def analyze_focus(
+    graph,
+    nodes_df,
+    focus_node,
+    max_depth=1,
+    csr=None
+):
+    """
+    Runs the upstream/downstream traversal once and returns
+    (upstream, downstream, subgraph, impact metrics).
+    """
+
+    upstream, downstream, subgraph, down_mask, start = _dependency_subgraph(
+        graph,
+        focus_node,
+        max_depth,
+        csr
+    )
+
     if focus_node is None or focus_node not in graph:
-        return {
+        return upstream, downstream, subgraph, {
             "upstream_count": 0,
             "downstream_count": 0,
             "regions_affected": 0,
             "downstream_weight": 0
         }
 
-    # --- Upstream ---
-    upstream = set()
-    current = {focus_node}
-
-    for _ in range(max_depth):
-        parents = set()
-        for n in current:
-            parents |= set(graph.predecessors(n))
-        upstream |= parents
-        current = parents
-
-    # --- Downstream ---
-    downstream = set()
-    current = {focus_node}
-
-    for _ in range(max_depth):
-        children = set()
-        for n in current:
-            children |= set(graph.successors(n))
-        downstream |= children
-        current = children
-
     # --- Regions affected ---
-    downstream_nodes_df = nodes_df[
-        nodes_df["id"].isin(downstream)
-    ]
-
-    regions_affected = downstream_nodes_df["region"].nunique()
+    regions_affected = nodes_df.loc[
+        nodes_df["id"].isin(downstream), "region"
+    ].nunique()
 
     # --- Total downstream dependency weight ---
-    downstream_weight = 0
-
-    for u, v, data in graph.edges(data=True):
-        if u in downstream or u == focus_node:
+    if csr is not None:
+        dst_mask = down_mask
+        src_mask = dst_mask.copy()
+        src_mask[start] = True
+
+        downstream_weight = csr["edge_weight"][
+            src_mask[csr["edge_from"]] & dst_mask[csr["edge_to"]]
+        ].sum().item()
+    else:
+        # Only edges leaving the focus node or a downstream node can count
+        downstream_weight = 0
+
+        for _, v, w in graph.out_edges(
+            downstream | {focus_node}, data="weight", default=0
+        ):
             if v in downstream:
-                downstream_weight += data.get("weight", 0)
+                downstream_weight += w
 
-    return {
+    return upstream, downstream, subgraph, {
         "upstream_count": len(upstream),
         "downstream_count": len(downstream),
         "regions_affected": regions_affected,
         "downstream_weight": downstream_weight
     }
-
-
@@ -1,11 +1,12 @@
 import streamlit as st
-import pandas as pd
 import io
+from openpyxl import Workbook
 
 from data_utils import (
     load_data,
     generate_edge_list,
     build_graph,
+    build_csr,
     diagnostics_summary,
     find_nodes_with_missing_coords,
     find_isolated_nodes,
@@ -43,6 +44,7 @@ edges = st.session_state.get("edges_generated")
 
 if edges is not None:
     G = build_graph(nodes, edges)
+    csr = build_csr(nodes, edges)
 
     # --------------------------------------------------
     # High-level diagnostics
@@ -77,7 +79,7 @@ if edges is not None:
         st.warning("Some nodes have missing coordinates")
         st.dataframe(missing_coords)
 
-    isolated_nodes = find_isolated_nodes(G)
+    isolated_nodes = find_isolated_nodes(G, csr=csr)
 
     if isolated_nodes:
         st.warning("Some nodes are isolated")
@@ -99,13 +101,15 @@ if edges is not None:
     # --------------------------------------------------
     st.header("Export")
 
+    # Write-only workbook streams rows out instead of building
+    # every cell in memory
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        edges.to_excel(
-            writer,
-            sheet_name="EDGES",
-            index=False
-        )
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("EDGES")
+    ws.append(list(edges.columns))
+    for row in edges.itertuples(index=False, name=None):
+        ws.append(row)
+    wb.save(output)
 
     st.download_button(
         label="Download EDGES.xlsx",
@@ -114,6 +118,13 @@ if edges is not None:
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
 
+    st.download_button(
+        label="Download EDGES.parquet",
+        data=edges.to_parquet(index=False),
+        file_name="EDGES.parquet",
+        mime="application/vnd.apache.parquet"
+    )
+
 else:
     st.info("Generate the edge list to view diagnostics and export.")
 